@@ -23,6 +23,8 @@ def main() -> int:
                         help='Do not create backup when overwriting input file')
     parser.add_argument('--analyze', action='store_true',
                         help='Only analyze the file, do not modify')
+    parser.add_argument('--fast', action='store_true',
+                        help='Skip structural validation (faster for batches of trusted files)')
     parser.add_argument('-q', '--quiet', action='store_true',
                         help='Suppress output except errors')
     parser.add_argument('--version', action='version', version='%(prog)s 0.1.0')
@@ -35,7 +37,8 @@ def main() -> int:
             if not args.quiet:
                 _print_analysis(args.input, result)
         else:
-            result = shrink_vsdx(args.input, args.output, backup=not args.no_backup)
+            result = shrink_vsdx(args.input, args.output, backup=not args.no_backup,
+                                 validate=not args.fast)
             if not args.quiet:
                 _print_shrink_result(args.input, result)
         return 0
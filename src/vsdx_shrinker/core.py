@@ -6,14 +6,27 @@ unused master shapes that bloat file size, typically caused by copy-pasting from
 PDFs or other vector sources.
 """
 
+import os
 import re
 import shutil
 import tempfile
+import threading
 import zipfile
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
 from typing import Set, Dict, List, Optional
-from xml.etree import ElementTree as ET
+from xml.sax.saxutils import escape
+
+try:
+    # lxml parses and serializes in C and is ~10x faster on large masters.xml;
+    # the subset of the API used here is identical to the stdlib.
+    from lxml import etree as ET
+    HAS_LXML = True
+except ImportError:
+    from xml.etree import ElementTree as ET  # type: ignore[no-redef]
+    HAS_LXML = False
 
 
 # XML namespaces used in VSDX files
@@ -21,11 +34,31 @@ VISIO_NS = 'http://schemas.microsoft.com/office/visio/2012/main'
 REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
 PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
 
+# Archive member names within a VSDX package
+MASTERS_PREFIX = 'visio/masters/'
+MASTERS_XML_NAME = 'visio/masters/masters.xml'
+MASTERS_RELS_NAME = 'visio/masters/_rels/masters.xml.rels'
+PAGES_PREFIX = 'visio/pages/'
+PAGES_RELS_NAME = 'visio/pages/_rels/pages.xml.rels'
+
 NAMESPACES = {'v': VISIO_NS, 'r': REL_NS}
 
-# Regex patterns for finding master references in page XML
-_USE_PATTERN = re.compile(r'\bUSE\("([^"]+)"\)')
-_MASTER_ATTR_PATTERN = re.compile(r'\bMaster=(["\'])(\d+)\1')
+# Qualified names, built once: formatting these in hot loops shows up in
+# profiles for files with thousands of masters.
+VISIO_MASTER_TAG = f'{{{VISIO_NS}}}Master'
+VISIO_REL_TAG = f'{{{VISIO_NS}}}Rel'
+PKG_REL_TAG = f'{{{PKG_REL_NS}}}Relationship'
+REL_ID_ATTR = f'{{{REL_NS}}}id'
+
+# Combined pattern for finding master references in page XML: USE("name")
+# formulas and Master="ID" shape attributes, matched in a single pass over
+# the raw UTF-8 bytes (skipping the full-page decode). \b is ASCII-only in
+# bytes patterns, so a lookbehind that also treats high bytes (UTF-8
+# continuations of non-ASCII letters) as word characters replaces it.
+_USED_RE = re.compile(
+    rb'(?<![0-9A-Za-z_\x80-\xff])USE\("(?P<name>[^"]+)"\)'
+    rb'|(?<![0-9A-Za-z_\x80-\xff])Master=(?P<q>["\'])(?P<mid>\d+)(?P=q)'
+)
 
 for prefix, uri in NAMESPACES.items():
     ET.register_namespace(prefix, uri)
@@ -36,14 +69,27 @@ class VsdxFormatError(Exception):
     pass
 
 
-@dataclass
-class VsdxPaths:
-    """Paths to key directories and files within an extracted VSDX."""
-    root: Path
-    pages_dir: Path
-    masters_dir: Path
-    masters_xml: Path
-    rels_path: Path
+@dataclass(slots=True)
+class MastersTable:
+    """Masters from masters.xml in struct-of-arrays form.
+
+    Parallel lists share one index per master, with prebuilt name and ID
+    indexes, so the joins in page scanning, size accounting, and removal
+    are list loads on an int instead of nested dict lookups.
+    """
+    names: List[str]
+    ids: List[str]
+    rel_ids: List[str]
+    elements: List[Optional[ET.Element]]
+    name_to_idx: Dict[str, int] = field(init=False)
+    id_to_idx: Dict[str, int] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.name_to_idx = {name: i for i, name in enumerate(self.names)}
+        self.id_to_idx = {mid: i for i, mid in enumerate(self.ids)}
+
+    def __len__(self) -> int:
+        return len(self.names)
 
 
 def _bytes_to_mb(size_bytes: int) -> float:
@@ -62,86 +108,80 @@ def _validate_vsdx_path(path: str) -> Path:
     return p
 
 
-def _get_namespace(element: ET.Element) -> str:
-    """Extract namespace URI from an element's tag."""
-    if '}' in element.tag:
-        return element.tag.split('}')[0].lstrip('{')
+@lru_cache(maxsize=8)
+def _namespace_of_tag(tag: str) -> str:
+    """Extract the namespace URI from a qualified tag string."""
+    if '}' in tag:
+        return tag.split('}')[0].lstrip('{')
     return ''
 
 
-def _make_vsdx_paths(root: Path) -> VsdxPaths:
-    """Create VsdxPaths from an extraction root directory."""
-    masters_dir = root / 'visio' / 'masters'
-    return VsdxPaths(
-        root=root,
-        pages_dir=root / 'visio' / 'pages',
-        masters_dir=masters_dir,
-        masters_xml=masters_dir / 'masters.xml',
-        rels_path=masters_dir / '_rels' / 'masters.xml.rels',
-    )
+def _get_namespace(element: ET.Element) -> str:
+    """Extract namespace URI from an element's tag.
+
+    All elements of a document share a handful of tag strings, so the
+    string splitting is cached on the tag itself.
+    """
+    return _namespace_of_tag(element.tag)
 
 
 def _get_rel_id(rel_element: Optional[ET.Element]) -> str:
     """Extract relationship ID from a Rel element."""
     if rel_element is None:
         return ''
-    return rel_element.get(f'{{{REL_NS}}}id', '') or rel_element.get('r:id', '')
-
-
-def _read_xml_file(path: Path) -> str:
-    """Read XML file content with encoding fallback."""
-    try:
-        return path.read_text(encoding='utf-8')
-    except UnicodeDecodeError:
-        return path.read_text(encoding='utf-8-sig')  # BOM variant
+    return rel_element.get(REL_ID_ATTR, '') or rel_element.get('r:id', '')
 
 
-def _parse_xml_file(path: Path) -> ET.Element:
-    """Parse XML file with error handling."""
+def _parse_xml_bytes(data: bytes, name: str) -> ET.Element:
+    """Parse XML from raw bytes (as read from the ZIP) with error handling."""
     try:
-        tree = ET.parse(path)
-        return tree.getroot()
+        return ET.fromstring(data)
     except ET.ParseError as e:
-        raise VsdxFormatError(f"Invalid XML in {path.name}: {e}")
+        raise VsdxFormatError(f"Invalid XML in {name}: {e}")
 
 
-def _get_page_files(pages_dir: Path) -> List[Path]:
-    """Get page files, checking pages.xml relationships with fallback to glob."""
-    page_files: List[Path] = []
+def _get_page_names(zf: zipfile.ZipFile, names: Set[str]) -> List[str]:
+    """Get page member names from the ZIP, checking pages.xml relationships
+    with fallback to a name-pattern scan. Membership checks hit the already
+    built namelist set, never the archive."""
+    page_names: List[str] = []
 
-    # Try to get pages from pages.xml relationships
-    pages_rels = pages_dir / '_rels' / 'pages.xml.rels'
-    if pages_rels.exists():
+    if PAGES_RELS_NAME in names:
         try:
-            root = _parse_xml_file(pages_rels)
-            for rel in root.findall(f'.//{{{PKG_REL_NS}}}Relationship'):
+            root = _parse_xml_bytes(zf.read(PAGES_RELS_NAME), PAGES_RELS_NAME)
+            for rel in root.iterfind(PKG_REL_TAG):
                 target = rel.get('Target', '')
                 if target:
-                    page_path = pages_dir / target
-                    if page_path.exists():
-                        page_files.append(page_path)
+                    page_name = PAGES_PREFIX + target
+                    if page_name in names:
+                        page_names.append(page_name)
         except VsdxFormatError:
-            pass  # Fall back to glob
+            pass  # Fall back to pattern scan
 
-    # Fallback to glob pattern if no pages found via rels
-    if not page_files:
-        page_files = list(pages_dir.glob("page*.xml"))
+    if not page_names:
+        page_names = sorted(
+            n for n in names
+            if n.startswith(PAGES_PREFIX + 'page') and n.endswith('.xml')
+            and '/' not in n[len(PAGES_PREFIX):]
+        )
 
-    return page_files
+    return page_names
 
 
 def _validate_vsdx_structure(
-    paths: VsdxPaths,
     masters_root: ET.Element,
     rels_root: Optional[ET.Element] = None,
+    *,
+    has_rels: bool,
+    has_pages: bool,
 ) -> None:
     """Validate VSDX structure using pre-parsed XML roots. Raises VsdxFormatError if invalid."""
     errors: List[str] = []
 
     # 1. Required files
-    if not paths.rels_path.exists():
-        errors.append(f"Missing relationships file: {paths.rels_path.name}")
-    if not paths.pages_dir.exists():
+    if not has_rels:
+        errors.append("Missing relationships file: masters.xml.rels")
+    if not has_pages:
         errors.append("Missing pages directory")
 
     # 2. Visio namespace validation
@@ -150,7 +190,7 @@ def _validate_vsdx_structure(
         errors.append(f"Unexpected namespace: {ns}\n    Expected: {VISIO_NS}")
 
     # 3. Master element structure validation
-    masters = masters_root.findall('.//v:Master', NAMESPACES)
+    masters = masters_root.findall(VISIO_MASTER_TAG)
     if masters:
         sample = masters[0]
         # Only ID is truly required; NameU is optional (some Visio files omit it)
@@ -158,11 +198,11 @@ def _validate_vsdx_structure(
             errors.append("Master elements missing required attribute: ID")
 
         # Check Rel child element exists and uses expected namespace
-        rel = sample.find('.//v:Rel', NAMESPACES)
+        rel = sample.find(VISIO_REL_TAG)
         if rel is None:
             errors.append("Master elements missing Rel child element")
         else:
-            rel_id_full_ns = f'{{{REL_NS}}}id'
+            rel_id_full_ns = REL_ID_ATTR
             has_full_ns = rel_id_full_ns in rel.attrib
             has_prefixed = 'r:id' in rel.attrib
             if not has_full_ns and not has_prefixed:
@@ -179,7 +219,7 @@ def _validate_vsdx_structure(
         if rels_ns and rels_ns != PKG_REL_NS:
             errors.append(f"Unexpected relationships namespace: {rels_ns}\n    Expected: {PKG_REL_NS}")
 
-        for rel in rels_root.findall(f'.//{{{PKG_REL_NS}}}Relationship'):
+        for rel in rels_root.iterfind(PKG_REL_TAG):
             rel_id = rel.get('Id', '')
             if rel_id:
                 rels_ids.add(rel_id)
@@ -187,7 +227,7 @@ def _validate_vsdx_structure(
     # 5. Relationship integrity: every master's Rel r:id must exist in .rels
     if masters and rels_ids:
         for master in masters:
-            rel = master.find('.//v:Rel', NAMESPACES)
+            rel = master.find(VISIO_REL_TAG)
             if rel is not None:
                 rel_id = _get_rel_id(rel)
                 if rel_id and rel_id not in rels_ids:
@@ -202,68 +242,154 @@ def _validate_vsdx_structure(
         )
 
 
-def _find_used_masters(pages_dir: Path, masters_info: Dict[str, Dict]) -> Set[str]:
-    """Find masters referenced by USE() patterns OR Shape Master attributes."""
+# Successful structural validations, keyed by file identity, so batch runs
+# over unchanged files skip the repeat integrity walk. Bounded FIFO.
+_VALIDATION_CACHE: Dict[tuple, bool] = {}
+_VALIDATION_CACHE_MAX = 64
+
+
+def _validate_cached(
+    source: Path,
+    masters_root: ET.Element,
+    rels_root: Optional[ET.Element],
+    *,
+    has_rels: bool,
+    has_pages: bool,
+) -> None:
+    """Validate structure, memoizing successful results per source file.
+
+    The cache key includes mtime and size so an edited file is re-checked.
+    Failures raise and are never cached.
+    """
+    stat = source.stat()
+    key = (str(source), stat.st_mtime_ns, stat.st_size)
+    if key in _VALIDATION_CACHE:
+        return
+
+    _validate_vsdx_structure(
+        masters_root, rels_root, has_rels=has_rels, has_pages=has_pages
+    )
+
+    if len(_VALIDATION_CACHE) >= _VALIDATION_CACHE_MAX:
+        _VALIDATION_CACHE.pop(next(iter(_VALIDATION_CACHE)))
+    _VALIDATION_CACHE[key] = True
+
+
+def _scan_page_content(content: bytes, masters: 'MastersTable') -> Set[str]:
+    """Scan one page's raw XML bytes and return the master names referenced.
+
+    Only the matched substrings are decoded, never the whole page.
+    """
     used_names: Set[str] = set()
+    for match in _USED_RE.finditer(content):
+        name = match.group('name')
+        if name is not None:
+            # USE("name") pattern (formula inheritance)
+            used_names.add(name.decode('utf-8'))
+        else:
+            # Master="ID" attribute on a shape (instance relationship)
+            idx = masters.id_to_idx.get(match.group('mid').decode('ascii'))
+            if idx is not None:
+                used_names.add(masters.names[idx])
+    return used_names
+
 
-    # Build ID -> Name lookup for Master="ID" references
-    id_to_name = {info['id']: name for name, info in masters_info.items()}
+def _find_used_masters_in_zip(
+    zf: zipfile.ZipFile,
+    page_names: List[str],
+    masters: MastersTable,
+) -> Set[str]:
+    """Find used masters by scanning pages directly from the ZIP (no extraction).
 
-    for page_file in _get_page_files(pages_dir):
-        content = _read_xml_file(page_file)
+    Bytes-level regex matching runs in C and large files can have hundreds
+    of pages, so the scans parallelize well. Workers decompress one member
+    at a time under a lock (the ZipFile shares a single file handle) and
+    scan outside it, so at most max_workers pages are held in memory at
+    once; a single page is scanned inline.
+    """
+    read_lock = threading.Lock()
+
+    def read_and_scan(page_name: str) -> Set[str]:
+        with read_lock:
+            content = zf.read(page_name)
+        return _scan_page_content(content, masters)
+
+    used_names: Set[str] = set()
 
-        # Method 1: USE("name") patterns (formula inheritance)
-        used_names.update(_USE_PATTERN.findall(content))
+    if len(page_names) <= 1:
+        for page_name in page_names:
+            used_names |= read_and_scan(page_name)
+        return used_names
 
-        # Method 2: Master="ID" attributes on shapes (instance relationship)
-        for _, master_id in _MASTER_ATTR_PATTERN.findall(content):
-            if master_id in id_to_name:
-                used_names.add(id_to_name[master_id])
+    max_workers = min(8, os.cpu_count() or 1, len(page_names))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for page_used in executor.map(read_and_scan, page_names):
+            used_names |= page_used
 
     return used_names
 
 
-def _parse_masters_xml(masters_xml_path: Path) -> tuple[ET.Element, Dict[str, Dict]]:
-    """Parse masters.xml and return (root element, {name: {id, rel_id, element}})."""
-    tree = ET.parse(masters_xml_path)
-    root = tree.getroot()
+def _masters_table_from_root(root: ET.Element) -> MastersTable:
+    """Build a MastersTable from a parsed masters.xml root."""
+    names: List[str] = []
+    ids: List[str] = []
+    rel_ids: List[str] = []
+    elements: List[Optional[ET.Element]] = []
 
-    masters_info: Dict[str, Dict] = {}
-    for master in root.findall('.//v:Master', NAMESPACES):
+    seen: Set[str] = set()
+    for master in root.iterfind(VISIO_MASTER_TAG):
         name = master.get('NameU', '') or master.get('Name', '') or master.get('ID', '')
         if name:
             # Use ID as key when NameU collides to avoid silently losing masters
-            key = name if name not in masters_info else master.get('ID', name)
-            rel = master.find('.//v:Rel', NAMESPACES)
-            masters_info[key] = {
-                'id': master.get('ID', ''),
-                'rel_id': _get_rel_id(rel),
-                'element': master,
-            }
-
-    return root, masters_info
+            key = name if name not in seen else master.get('ID', name)
+            seen.add(key)
+            names.append(key)
+            ids.append(master.get('ID', ''))
+            rel_ids.append(_get_rel_id(master.find(VISIO_REL_TAG)))
+            elements.append(master)
 
+    return MastersTable(names=names, ids=ids, rel_ids=rel_ids, elements=elements)
 
-def _parse_rels_xml(rels_path: Path) -> tuple[ET.Element, Dict[str, str]]:
-    """Parse masters.xml.rels and return (root element, {rId: target_filename})."""
-    tree = ET.parse(rels_path)
-    root = tree.getroot()
 
+def _rels_info_from_root(root: ET.Element) -> Dict[str, str]:
+    """Build {rId: target_filename} from a parsed masters.xml.rels root."""
     rels_info: Dict[str, str] = {}
-    for rel in root.findall(f'.//{{{PKG_REL_NS}}}Relationship'):
+    for rel in root.iterfind(PKG_REL_TAG):
         rel_id, target = rel.get('Id', ''), rel.get('Target', '')
         if rel_id and target:
             rels_info[rel_id] = target
 
-    return root, rels_info
+    return rels_info
+
+
+# Tab/newline/CR in attribute values must become character references, or
+# the next parser silently normalizes them to spaces (XML attribute-value
+# normalization) and the Target round-trips changed.
+_ATTR_ESCAPES = {'"': '&quot;', '\t': '&#09;', '\n': '&#10;', '\r': '&#13;'}
 
 
-def _create_vsdx(source_dir: Path, output_path: Path) -> None:
-    """Create a VSDX file from an extracted directory."""
-    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for file_path in source_dir.rglob('*'):
-            if file_path.is_file():
-                zf.write(file_path, file_path.relative_to(source_dir))
+def _escape_attr(value: str) -> str:
+    """Escape an XML attribute value, with a fast path for the common case."""
+    if not any(c in value for c in '&<>"\t\n\r'):
+        return value
+    return escape(value, _ATTR_ESCAPES)
+
+
+def _serialize_rels(rels: List[ET.Element]) -> bytes:
+    """Serialize Relationship elements to masters.xml.rels bytes directly.
+
+    The .rels file is a flat list of attribute-only elements, so assembling
+    the document by string join skips the generic tree serializer entirely.
+    """
+    parts = [
+        '<?xml version="1.0" encoding="utf-8"?>',
+        f'<Relationships xmlns="{PKG_REL_NS}">',
+    ]
+    for rel in rels:
+        attrs = ' '.join(f'{k}="{_escape_attr(v)}"' for k, v in rel.attrib.items())
+        parts.append(f'<Relationship {attrs}/>' if attrs else '<Relationship/>')
+    parts.append('</Relationships>')
+    return ''.join(parts).encode('utf-8')
 
 
 def _empty_result(original_size: int = 0, output_path: str = '') -> Dict:
@@ -279,21 +405,32 @@ def _empty_result(original_size: int = 0, output_path: str = '') -> Dict:
     }
 
 
+def _master_sizes(zf: zipfile.ZipFile) -> Dict[str, int]:
+    """Map master member names to uncompressed sizes from the central directory."""
+    return {
+        info.filename: info.file_size
+        for info in zf.infolist()
+        if info.filename.startswith(MASTERS_PREFIX)
+    }
+
+
 def _calculate_unused_size(
     unused_names: Set[str],
-    masters_info: Dict[str, Dict],
+    masters: MastersTable,
     rels_info: Dict[str, str],
-    masters_dir: Path,
+    name_to_size: Dict[str, int],
 ) -> int:
-    """Calculate total size of unused master files."""
+    """Calculate total uncompressed size of unused master files.
+
+    Sizes come from the ZIP central directory, so a missing member is
+    simply absent from the map — no per-file lookups or stats.
+    """
     total = 0
     for name in unused_names:
-        rel_id = masters_info.get(name, {}).get('rel_id', '')
-        target = rels_info.get(rel_id, '')
+        idx = masters.name_to_idx.get(name)
+        target = rels_info.get(masters.rel_ids[idx], '') if idx is not None else ''
         if target:
-            target_file = masters_dir / target
-            if target_file.exists():
-                total += target_file.stat().st_size
+            total += name_to_size.get(MASTERS_PREFIX + target, 0)
     return total
 
 
@@ -313,36 +450,48 @@ def analyze_vsdx(vsdx_path: str) -> Dict:
     """
     path = _validate_vsdx_path(vsdx_path)
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        extract_dir = Path(temp_dir)
-        with zipfile.ZipFile(path, 'r') as zf:
-            zf.extractall(extract_dir)
-
-        paths = _make_vsdx_paths(extract_dir)
+    with zipfile.ZipFile(path, 'r') as zf:
+        names = set(zf.namelist())
 
-        if not paths.masters_xml.exists():
+        if MASTERS_XML_NAME not in names:
             return {
                 'total_masters': 0, 'used_masters': 0, 'unused_masters': 0,
                 'used_names': [], 'unused_names': [], 'potential_savings_mb': 0.0,
             }
 
-        masters_root, masters_info = _parse_masters_xml(paths.masters_xml)
-        rels_root, rels_info = _parse_rels_xml(paths.rels_path)
-        _validate_vsdx_structure(paths, masters_root, rels_root)
+        masters_root = _parse_xml_bytes(zf.read(MASTERS_XML_NAME), MASTERS_XML_NAME)
+        masters = _masters_table_from_root(masters_root)
+
+        rels_root: Optional[ET.Element] = None
+        rels_info: Dict[str, str] = {}
+        if MASTERS_RELS_NAME in names:
+            rels_root = _parse_xml_bytes(zf.read(MASTERS_RELS_NAME), MASTERS_RELS_NAME)
+            rels_info = _rels_info_from_root(rels_root)
+
+        _validate_cached(
+            path, masters_root, rels_root,
+            has_rels=MASTERS_RELS_NAME in names,
+            has_pages=any(n.startswith(PAGES_PREFIX) for n in names),
+        )
+
+        page_names = _get_page_names(zf, names)
+        used_names = _find_used_masters_in_zip(zf, page_names, masters)
 
-        used_names = _find_used_masters(paths.pages_dir, masters_info)
-        all_names = set(masters_info.keys())
+        # Narrow to names actually present in masters.xml once; dict key
+        # views support set operations without building an extra set.
+        all_names = masters.name_to_idx.keys()
+        used_valid = used_names & all_names
         unused_names = all_names - used_names
 
         unused_size = _calculate_unused_size(
-            unused_names, masters_info, rels_info, paths.masters_dir
+            unused_names, masters, rels_info, _master_sizes(zf)
         )
 
         return {
             'total_masters': len(all_names),
-            'used_masters': len(used_names & all_names),
+            'used_masters': len(used_valid),
             'unused_masters': len(unused_names),
-            'used_names': sorted(used_names & all_names),
+            'used_names': sorted(used_valid),
             'unused_names': sorted(unused_names),
             'potential_savings_mb': _bytes_to_mb(unused_size),
         }
@@ -352,6 +501,7 @@ def shrink_vsdx(
     input_path: str,
     output_path: Optional[str] = None,
     backup: bool = True,
+    validate: bool = True,
 ) -> Dict:
     """
     Remove unused master shapes from a VSDX file.
@@ -360,6 +510,8 @@ def shrink_vsdx(
         input_path: Path to the input .vsdx file
         output_path: Path for output file. If None, overwrites input (with backup)
         backup: If True and output_path is None, create a .bak backup
+        validate: If False, skip structural validation (faster for batch
+            runs over files already known to be well-formed)
 
     Returns:
         Dictionary with: original_size_mb, new_size_mb, reduction_mb,
@@ -380,80 +532,126 @@ def shrink_vsdx(
         final_output = Path(output_path)
 
     with tempfile.TemporaryDirectory() as temp_dir:
-        temp_root = Path(temp_dir)
-        extract_dir = temp_root / 'extracted'
-
-        with zipfile.ZipFile(path, 'r') as zf:
-            zf.extractall(extract_dir)
-
-        paths = _make_vsdx_paths(extract_dir)
-
-        if not paths.masters_xml.exists():
-            if final_output != path:
-                shutil.copy2(path, final_output)
-            return _empty_result(original_size, str(final_output))
-
-        # Parse masters and relationships, then validate
-        masters_root, masters_info = _parse_masters_xml(paths.masters_xml)
-        rels_root, rels_info = _parse_rels_xml(paths.rels_path)
-        _validate_vsdx_structure(paths, masters_root, rels_root)
-
-        # Identify used vs unused masters (both USE() and Master="ID" references)
-        used_names = _find_used_masters(paths.pages_dir, masters_info)
-
-        all_names = set(masters_info.keys())
-        names_to_remove = all_names - used_names
-
-        # Determine what to keep
-        keep_rel_ids: Set[str] = set()
-        keep_files: Set[str] = set()
-        for name in used_names:
-            if name in masters_info:
-                rel_id = masters_info[name]['rel_id']
-                keep_rel_ids.add(rel_id)
-                if rel_id in rels_info:
-                    keep_files.add(rels_info[rel_id])
-
-        # Remove unused masters from XML
-        masters_removed = 0
-        for name in names_to_remove:
-            if name in masters_info:
-                masters_root.remove(masters_info[name]['element'])
-                masters_removed += 1
-
-        # Clean up orphaned masters whose backing file is already missing
-        # (e.g. from a previous run with the NameU bug)
-        for name in list(used_names):
-            if name in masters_info:
-                rel_id = masters_info[name]['rel_id']
-                target = rels_info.get(rel_id, '')
-                if not target or not (paths.masters_dir / target).exists():
-                    masters_root.remove(masters_info[name]['element'])
-                    keep_rel_ids.discard(rel_id)
-                    masters_removed += 1
-
-        ET.ElementTree(masters_root).write(
-            paths.masters_xml, encoding='utf-8', xml_declaration=True
-        )
-
-        # Remove unused relationships
-        for rel in list(rels_root):
-            rel_id = rel.get('Id', '')
-            if rel_id and rel_id not in keep_rel_ids:
-                rels_root.remove(rel)
-
-        ET.ElementTree(rels_root).write(
-            paths.rels_path, encoding='utf-8', xml_declaration=True
-        )
-
-        # Delete unused master files
-        for master_file in paths.masters_dir.glob('master*.xml'):
-            if master_file.name != 'masters.xml' and master_file.name not in keep_files:
-                master_file.unlink()
+        temp_output = Path(temp_dir) / 'output.vsdx'
+
+        with zipfile.ZipFile(path, 'r') as src:
+            names = set(src.namelist())
+
+            if MASTERS_XML_NAME not in names:
+                if final_output != path:
+                    shutil.copy2(path, final_output)
+                return _empty_result(original_size, str(final_output))
+
+            # Parse masters and relationships, then validate
+            masters_root = _parse_xml_bytes(src.read(MASTERS_XML_NAME), MASTERS_XML_NAME)
+            masters = _masters_table_from_root(masters_root)
+
+            rels_root: Optional[ET.Element] = None
+            rels_info: Dict[str, str] = {}
+            if MASTERS_RELS_NAME in names:
+                rels_root = _parse_xml_bytes(src.read(MASTERS_RELS_NAME), MASTERS_RELS_NAME)
+                rels_info = _rels_info_from_root(rels_root)
+
+            if validate:
+                _validate_cached(
+                    path, masters_root, rels_root,
+                    has_rels=MASTERS_RELS_NAME in names,
+                    has_pages=any(n.startswith(PAGES_PREFIX) for n in names),
+                )
+
+            # Even with validation skipped, the rewrite below cannot proceed
+            # without the relationships file mapping masters to their members
+            if rels_root is None:
+                raise VsdxFormatError("Missing relationships file: masters.xml.rels")
+
+            # Identify used vs unused masters (both USE() and Master="ID" references)
+            page_names = _get_page_names(src, names)
+            used_names = _find_used_masters_in_zip(src, page_names, masters)
+
+            names_to_remove = masters.name_to_idx.keys() - used_names
+
+            # Determine what to keep
+            keep_rel_ids: Set[str] = set()
+            keep_files: Set[str] = set()
+            for name in used_names:
+                idx = masters.name_to_idx.get(name)
+                if idx is not None:
+                    rel_id = masters.rel_ids[idx]
+                    keep_rel_ids.add(rel_id)
+                    if rel_id in rels_info:
+                        keep_files.add(rels_info[rel_id])
+
+            # Collect the elements to drop: unused masters, plus orphaned
+            # masters whose backing member is already missing (e.g. from a
+            # previous run with the NameU bug)
+            drop_elements = {
+                id(masters.elements[masters.name_to_idx[name]])
+                for name in names_to_remove
+            }
+            for name in used_names:
+                idx = masters.name_to_idx.get(name)
+                if idx is not None:
+                    rel_id = masters.rel_ids[idx]
+                    target = rels_info.get(rel_id, '')
+                    if not target or f'{MASTERS_PREFIX}{target}' not in names:
+                        drop_elements.add(id(masters.elements[idx]))
+                        keep_rel_ids.discard(rel_id)
+
+            # Unused master files to drop from the archive
+            deleted_names: Set[str] = set()
+            for name in names:
+                if name.startswith(MASTERS_PREFIX):
+                    base = name[len(MASTERS_PREFIX):]
+                    if ('/' not in base and base.startswith('master')
+                            and base.endswith('.xml')
+                            and base != 'masters.xml' and base not in keep_files):
+                        deleted_names.add(name)
+
+            # Nothing to remove: skip the whole rewrite for already-clean files
+            if not drop_elements and not deleted_names:
+                if final_output != path:
+                    shutil.copy2(path, final_output)
+                return _empty_result(original_size, str(final_output))
+
+            # Element.remove is a linear scan of the children, so removing k
+            # of N masters one by one is O(k*N); rebuild the child list once.
+            masters_removed = len(drop_elements)
+            if drop_elements:
+                masters_root[:] = [
+                    child for child in masters_root if id(child) not in drop_elements
+                ]
+
+            masters_bytes = ET.tostring(
+                masters_root, encoding='utf-8', xml_declaration=True
+            )
+
+            # Keep only used relationships and serialize them directly
+            kept_rels = [
+                rel for rel in rels_root
+                if rel.tag == PKG_REL_TAG
+                and (not rel.get('Id') or rel.get('Id') in keep_rel_ids)
+            ]
+            rels_bytes = _serialize_rels(kept_rels)
+
+            # Stream a new archive: rewritten masters/rels, dropped unused
+            # master files, everything else copied member-for-member without
+            # extracting to disk. Deflate level 1: recompression dominates
+            # wall time for large files and the size difference vs level 6
+            # is small for XML content. The level must ride on each writestr
+            # call — with a reused source ZipInfo, writestr takes the level
+            # from the info object and ignores the ZipFile-wide setting.
+            with zipfile.ZipFile(temp_output, 'w', zipfile.ZIP_DEFLATED) as dst:
+                for info in src.infolist():
+                    member = info.filename
+                    if member in deleted_names:
+                        continue
+                    if member == MASTERS_XML_NAME:
+                        dst.writestr(info, masters_bytes, compresslevel=1)
+                    elif member == MASTERS_RELS_NAME:
+                        dst.writestr(info, rels_bytes, compresslevel=1)
+                    else:
+                        dst.writestr(info, src.read(member), compresslevel=1)
 
-        # Create new VSDX
-        temp_output = temp_root / 'output.vsdx'
-        _create_vsdx(extract_dir, temp_output)
         shutil.move(str(temp_output), str(final_output))
 
     new_size = final_output.stat().st_size
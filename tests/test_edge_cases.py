@@ -8,11 +8,6 @@ and negative-zero floating-point artifacts.
 """
 
 import math
-import os
-import shutil
-import tempfile
-from contextlib import contextmanager
-from pathlib import Path
 from xml.etree import ElementTree as ET
 
 import pytest
@@ -20,11 +15,14 @@ from hypothesis import given
 from hypothesis import strategies as st
 
 from vsdx_shrinker.core import (
+    MastersTable,
     _bytes_to_mb,
     _get_namespace,
     _get_rel_id,
-    _find_used_masters,
-    _parse_masters_xml,
+    _escape_attr,
+    _masters_table_from_root,
+    _parse_xml_bytes,
+    _scan_page_content,
     VISIO_NS,
     REL_NS,
 )
@@ -34,58 +32,42 @@ from vsdx_shrinker.core import (
 # helpers
 # ---------------------------------------------------------------------------
 
-@contextmanager
-def _make_pages_dir(page_content: str):
-    """Create a temp pages directory with a single page file containing
-    ``page_content``.  Automatically cleaned up on exit."""
-    tmp = Path(tempfile.mkdtemp())
-    pages_dir = tmp / "pages"
-    pages_dir.mkdir()
-    (pages_dir / "page1.xml").write_text(page_content, encoding="utf-8")
-    try:
-        yield pages_dir
-    finally:
-        shutil.rmtree(tmp)
-
-
-def _write_masters_xml(xml_content: str) -> Path:
-    fd, path = tempfile.mkstemp(suffix=".xml")
-    os.write(fd, xml_content.encode("utf-8"))
-    os.close(fd)
-    return Path(path)
+def _scan(page_content: str, masters: MastersTable) -> set:
+    """Scan a page given as text, the way shrink/analyze feed raw page bytes
+    into _scan_page_content."""
+    return _scan_page_content(page_content.encode("utf-8"), masters)
 
 
 # ---------------------------------------------------------------------------
 # Bug 1: USE() regex lacked \b word boundary
 #
 # REFUSE("X"), FUSE("X"), etc. were falsely matched, marking masters as
-# "used" and preventing their removal.  We test _find_used_masters
-# end-to-end so the fix is validated where it actually runs.
+# "used" and preventing their removal.  We test _scan_page_content so the
+# fix is validated where the regex actually runs.
 # ---------------------------------------------------------------------------
 
 class TestUsePatternWordBoundary:
     """USE() regex must not match words that merely end in 'USE'."""
 
-    MASTERS_INFO = {"Arrow": {"id": "1", "rel_id": "rId1"}}
+    MASTERS = MastersTable(
+        names=["Arrow"], ids=["1"], rel_ids=["rId1"], elements=[None],
+    )
 
     def test_standalone_use_is_found(self):
-        with _make_pages_dir('USE("Arrow")') as pages_dir:
-            used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-            assert "Arrow" in used
+        used = _scan('USE("Arrow")', self.MASTERS)
+        assert "Arrow" in used
 
     def test_refuse_is_not_matched(self):
-        with _make_pages_dir('REFUSE("Arrow")') as pages_dir:
-            used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-            assert "Arrow" not in used, (
-                "REFUSE(\"Arrow\") falsely matched — missing \\b word boundary"
-            )
+        used = _scan('REFUSE("Arrow")', self.MASTERS)
+        assert "Arrow" not in used, (
+            "REFUSE(\"Arrow\") falsely matched — missing \\b word boundary"
+        )
 
     def test_fuse_abuse_reuse_not_matched(self):
         """Several words ending in USE must not trigger a false positive."""
         for prefix in ("FUSE", "ABUSE", "REUSE", "MISUSE"):
-            with _make_pages_dir(f'{prefix}("Arrow")') as pages_dir:
-                used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-                assert "Arrow" not in used, f"{prefix} falsely matched"
+            used = _scan(f'{prefix}("Arrow")', self.MASTERS)
+            assert "Arrow" not in used, f"{prefix} falsely matched"
 
     @given(prefix=st.text(
         alphabet=st.characters(whitelist_categories=("Lu",)),
@@ -93,39 +75,37 @@ class TestUsePatternWordBoundary:
     ))
     def test_no_alpha_prefix_matches(self, prefix):
         """Any alphabetic prefix + USE("X") must not match."""
-        with _make_pages_dir(f'{prefix}USE("Arrow")') as pages_dir:
-            used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-            assert "Arrow" not in used, f"{prefix}USE falsely matched"
+        used = _scan(f'{prefix}USE("Arrow")', self.MASTERS)
+        assert "Arrow" not in used, f"{prefix}USE falsely matched"
 
 
 # ---------------------------------------------------------------------------
 # Bug 2: master_attr_pattern allowed mismatched quotes
 #
-# Master="42' (double-open, single-close) was accepted.  Tested
-# end-to-end via _find_used_masters.
+# Master="42' (double-open, single-close) was accepted.  Tested via
+# _scan_page_content, where the regex runs.
 # ---------------------------------------------------------------------------
 
 class TestMasterAttrPattern:
-    MASTERS_INFO = {"Arrow": {"id": "42", "rel_id": "rId1"}}
+    MASTERS = MastersTable(
+        names=["Arrow"], ids=["42"], rel_ids=["rId1"], elements=[None],
+    )
 
     def test_matched_double_quotes_found(self):
-        with _make_pages_dir('<Shape Master="42"/>') as pages_dir:
-            used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-            assert "Arrow" in used
+        used = _scan('<Shape Master="42"/>', self.MASTERS)
+        assert "Arrow" in used
 
     def test_matched_single_quotes_found(self):
-        with _make_pages_dir("<Shape Master='42'/>") as pages_dir:
-            used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-            assert "Arrow" in used
+        used = _scan("<Shape Master='42'/>", self.MASTERS)
+        assert "Arrow" in used
 
     def test_mismatched_quotes_not_matched(self):
         """Mismatched quotes are not valid XML — must not match."""
         for content in ('Master="42\'', "Master='42\""):
-            with _make_pages_dir(content) as pages_dir:
-                used = _find_used_masters(pages_dir, self.MASTERS_INFO)
-                assert "Arrow" not in used, (
-                    f"Mismatched quotes in {content!r} falsely matched"
-                )
+            used = _scan(content, self.MASTERS)
+            assert "Arrow" not in used, (
+                f"Mismatched quotes in {content!r} falsely matched"
+            )
 
 
 # ---------------------------------------------------------------------------
@@ -161,13 +141,13 @@ class TestGetNamespace:
 
 
 # ---------------------------------------------------------------------------
-# Bug 4: _parse_masters_xml silently dropped duplicate NameU values
+# Bug 4: masters.xml parsing silently dropped duplicate NameU values
 #
 # Two <Master> elements with the same NameU overwrote each other in the
 # dict, making the first master invisible and unremovable.
 # ---------------------------------------------------------------------------
 
-class TestParseMastersXmlDuplicateNames:
+class TestMastersTableDuplicateNames:
     def test_duplicate_nameu_both_tracked(self):
         xml = f'''<?xml version="1.0" encoding="utf-8"?>
 <Masters xmlns="{VISIO_NS}" xmlns:r="{REL_NS}">
@@ -175,19 +155,15 @@ class TestParseMastersXmlDuplicateNames:
   <Master ID="2" NameU="Shape1"><Rel r:id="rId2"/></Master>
   <Master ID="3" NameU="Shape2"><Rel r:id="rId3"/></Master>
 </Masters>'''
-        path = _write_masters_xml(xml)
-        try:
-            _, masters_info = _parse_masters_xml(path)
-            all_ids = {info["id"] for info in masters_info.values()}
-            assert len(masters_info) == 3, (
-                f"Expected 3 masters, got {len(masters_info)}. "
-                f"Duplicate NameU caused silent overwrite."
-            )
-            assert all_ids == {"1", "2", "3"}, (
-                f"All master IDs must be preserved. Got: {all_ids}"
-            )
-        finally:
-            path.unlink()
+        root = _parse_xml_bytes(xml.encode("utf-8"), "masters.xml")
+        masters = _masters_table_from_root(root)
+        assert len(masters) == 3, (
+            f"Expected 3 masters, got {len(masters)}. "
+            f"Duplicate NameU caused silent overwrite."
+        )
+        assert set(masters.ids) == {"1", "2", "3"}, (
+            f"All master IDs must be preserved. Got: {set(masters.ids)}"
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -239,3 +215,27 @@ class TestGetRelId:
     def test_neither_attribute_returns_empty(self):
         e = ET.Element("Rel")
         assert _get_rel_id(e) == ""
+
+
+# ---------------------------------------------------------------------------
+# _escape_attr: attribute values must survive a serialize/parse round trip
+#
+# Raw tab/newline/CR in an attribute are legal to write but are turned
+# into plain spaces by attribute-value normalization on the next parse,
+# so they must be emitted as character references.
+# ---------------------------------------------------------------------------
+
+class TestEscapeAttr:
+    def test_plain_value_unchanged(self):
+        assert _escape_attr("media/master1.xml") == "media/master1.xml"
+
+    def test_special_chars_escaped(self):
+        assert _escape_attr('a&b<c>"d') == "a&amp;b&lt;c&gt;&quot;d"
+
+    def test_whitespace_becomes_char_refs(self):
+        assert _escape_attr("a\tb\nc\rd") == "a&#09;b&#10;c&#13;d"
+
+    def test_round_trip_through_parser(self):
+        value = 'odd\ttarget\nwith "quotes"'
+        xml = f'<R Target="{_escape_attr(value)}"/>'
+        assert ET.fromstring(xml).get("Target") == value
@@ -0,0 +1,281 @@
+"""
+End-to-end tests for analyze_vsdx/shrink_vsdx over small synthetic
+archives, exercising the streaming rewrite where it actually runs:
+the validate/--fast handling, the early exit on clean files,
+unused-master removal, orphan cleanup, and stray-file deletion.
+"""
+
+import sys
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree as ET
+
+import pytest
+
+from vsdx_shrinker import cli
+from vsdx_shrinker.core import (
+    analyze_vsdx,
+    shrink_vsdx,
+    VsdxFormatError,
+    VISIO_NS,
+    REL_NS,
+    PKG_REL_NS,
+    _VALIDATION_CACHE,
+)
+
+
+MASTER_TYPE = "http://schemas.microsoft.com/visio/2010/relationships/master"
+
+MASTERS_XML = f'''<?xml version="1.0" encoding="utf-8"?>
+<Masters xmlns="{VISIO_NS}" xmlns:r="{REL_NS}">
+  <Master ID="1" NameU="Used"><Rel r:id="rId1"/></Master>
+  <Master ID="2" NameU="Unused"><Rel r:id="rId2"/></Master>
+</Masters>'''
+
+MASTERS_RELS = f'''<?xml version="1.0" encoding="utf-8"?>
+<Relationships xmlns="{PKG_REL_NS}">
+  <Relationship Id="rId1" Type="{MASTER_TYPE}" Target="master1.xml"/>
+  <Relationship Id="rId2" Type="{MASTER_TYPE}" Target="master2.xml"/>
+</Relationships>'''
+
+PAGE_XML = '<PageContents><Shape><Cell F=\'USE("Used")\'/></Shape></PageContents>'
+
+
+def _default_members() -> dict:
+    return {
+        "visio/masters/masters.xml": MASTERS_XML,
+        "visio/masters/_rels/masters.xml.rels": MASTERS_RELS,
+        "visio/masters/master1.xml": "<MasterContents/>",
+        "visio/masters/master2.xml": "<MasterContents/>" * 50,
+        "visio/pages/page1.xml": PAGE_XML,
+    }
+
+
+def _write_vsdx(path: Path, members: dict) -> Path:
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return path
+
+
+def _member_names(path: Path) -> set:
+    with zipfile.ZipFile(path) as zf:
+        return set(zf.namelist())
+
+
+def _read_member(path: Path, name: str) -> bytes:
+    with zipfile.ZipFile(path) as zf:
+        return zf.read(name)
+
+
+# ---------------------------------------------------------------------------
+# validate= keyword (--fast on the CLI)
+# ---------------------------------------------------------------------------
+
+class TestValidateOption:
+    def _members_without_rels(self) -> dict:
+        members = _default_members()
+        del members["visio/masters/_rels/masters.xml.rels"]
+        return members
+
+    def _members_with_dangling_rel(self) -> dict:
+        """masters.xml referencing a relationship the .rels file lacks —
+        caught by the integrity walk, tolerated by the shrink itself."""
+        members = _default_members()
+        members["visio/masters/masters.xml"] = MASTERS_XML.replace(
+            'r:id="rId1"', 'r:id="rId9"'
+        )
+        return members
+
+    def test_missing_rels_raises_with_validation(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", self._members_without_rels())
+        with pytest.raises(VsdxFormatError, match="masters.xml.rels"):
+            shrink_vsdx(str(src), str(tmp_path / "out.vsdx"))
+
+    def test_missing_rels_raises_without_validation(self, tmp_path):
+        """validate=False must degrade to a clean format error, not a
+        TypeError from iterating a rels_root that was never parsed."""
+        src = _write_vsdx(tmp_path / "in.vsdx", self._members_without_rels())
+        with pytest.raises(VsdxFormatError, match="masters.xml.rels"):
+            shrink_vsdx(str(src), str(tmp_path / "out.vsdx"), validate=False)
+
+    def test_validate_false_skips_integrity_walk(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", self._members_with_dangling_rel())
+        out = tmp_path / "out.vsdx"
+        with pytest.raises(VsdxFormatError, match="non-existent relationship"):
+            shrink_vsdx(str(src), str(out))
+        result = shrink_vsdx(str(src), str(out), validate=False)
+        assert out.exists()
+        # the dangling master is dropped as an orphan, the unused one as unused
+        assert result["masters_removed"] == 2
+
+    def test_validate_false_still_shrinks(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        out = tmp_path / "out.vsdx"
+        result = shrink_vsdx(str(src), str(out), validate=False)
+        assert result["masters_removed"] == 1
+        assert "visio/masters/master2.xml" not in _member_names(out)
+
+    def test_fast_flag_skips_validation(self, tmp_path, monkeypatch, capsys):
+        src = _write_vsdx(tmp_path / "in.vsdx", self._members_with_dangling_rel())
+        out = tmp_path / "out.vsdx"
+        argv = ["vsdx-shrinker", str(src), "-o", str(out), "-q"]
+        monkeypatch.setattr(sys, "argv", argv)
+        assert cli.main() == 2  # validation rejects the dangling rel
+        monkeypatch.setattr(sys, "argv", argv + ["--fast"])
+        assert cli.main() == 0
+        assert out.exists()
+
+
+class TestValidationCache:
+    def _keys_for(self, path: Path) -> list:
+        return [k for k in _VALIDATION_CACHE if k[0] == str(path)]
+
+    def test_successful_validation_is_memoized(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        analyze_vsdx(str(src))
+        assert len(self._keys_for(src)) == 1
+        analyze_vsdx(str(src))
+        assert len(self._keys_for(src)) == 1
+
+    def test_modified_file_is_revalidated(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        analyze_vsdx(str(src))
+        members = _default_members()
+        members["visio/pages/page1.xml"] = PAGE_XML + "<!-- edited -->"
+        _write_vsdx(src, members)
+        analyze_vsdx(str(src))
+        # mtime/size changed, so a second key appears for the same path
+        assert len(self._keys_for(src)) == 2
+
+    def test_failed_validation_is_not_cached(self, tmp_path):
+        members = _default_members()
+        del members["visio/masters/_rels/masters.xml.rels"]
+        src = _write_vsdx(tmp_path / "in.vsdx", members)
+        with pytest.raises(VsdxFormatError):
+            analyze_vsdx(str(src))
+        assert self._keys_for(src) == []
+
+
+# ---------------------------------------------------------------------------
+# shrink round trip: dirty files
+# ---------------------------------------------------------------------------
+
+class TestShrinkRoundTrip:
+    def test_unused_master_removed(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        out = tmp_path / "out.vsdx"
+        result = shrink_vsdx(str(src), str(out))
+
+        assert result["masters_removed"] == 1
+        assert result["output_path"] == str(out)
+        names = _member_names(out)
+        assert "visio/masters/master2.xml" not in names
+        assert "visio/masters/master1.xml" in names
+        assert "visio/pages/page1.xml" in names
+
+    def test_rewritten_masters_xml_keeps_only_used(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        out = tmp_path / "out.vsdx"
+        shrink_vsdx(str(src), str(out))
+
+        root = ET.fromstring(_read_member(out, "visio/masters/masters.xml"))
+        masters = root.findall(f"{{{VISIO_NS}}}Master")
+        assert [m.get("NameU") for m in masters] == ["Used"]
+
+    def test_rewritten_rels_parse_and_keep_only_used(self, tmp_path):
+        """The hand-serialized .rels must parse and retain Id/Type/Target
+        of the surviving relationship only."""
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        out = tmp_path / "out.vsdx"
+        shrink_vsdx(str(src), str(out))
+
+        data = _read_member(out, "visio/masters/_rels/masters.xml.rels")
+        assert data.startswith(b"<?xml")
+        root = ET.fromstring(data)
+        rels = root.findall(f"{{{PKG_REL_NS}}}Relationship")
+        assert [(r.get("Id"), r.get("Target")) for r in rels] == [
+            ("rId1", "master1.xml")
+        ]
+        assert rels[0].get("Type") == MASTER_TYPE
+
+    def test_output_analyzes_clean(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        out = tmp_path / "out.vsdx"
+        shrink_vsdx(str(src), str(out))
+
+        result = analyze_vsdx(str(out))
+        assert result["total_masters"] == 1
+        assert result["unused_masters"] == 0
+        assert result["used_names"] == ["Used"]
+
+    def test_in_place_creates_backup(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _default_members())
+        original = src.read_bytes()
+        result = shrink_vsdx(str(src))
+
+        backup = tmp_path / "in.vsdx.bak"
+        assert backup.read_bytes() == original
+        assert result["masters_removed"] == 1
+        assert "visio/masters/master2.xml" not in _member_names(src)
+
+    def test_orphaned_master_dropped(self, tmp_path):
+        """A used master whose backing member is missing from the archive
+        must be dropped from masters.xml rather than kept dangling."""
+        members = _default_members()
+        del members["visio/masters/master1.xml"]
+        src = _write_vsdx(tmp_path / "in.vsdx", members)
+        out = tmp_path / "out.vsdx"
+        result = shrink_vsdx(str(src), str(out))
+
+        assert result["masters_removed"] == 2  # orphaned Used + unused Unused
+        root = ET.fromstring(_read_member(out, "visio/masters/masters.xml"))
+        assert root.findall(f"{{{VISIO_NS}}}Master") == []
+
+
+# ---------------------------------------------------------------------------
+# shrink round trip: clean files (nothing to remove)
+# ---------------------------------------------------------------------------
+
+CLEAN_PAGE_XML = (
+    '<PageContents><Shape Master="2">'
+    '<Cell F=\'USE("Used")\'/></Shape></PageContents>'
+)
+
+
+def _clean_members() -> dict:
+    members = _default_members()
+    members["visio/pages/page1.xml"] = CLEAN_PAGE_XML
+    return members
+
+
+class TestCleanFileEarlyExit:
+    def test_copy_to_output_is_byte_identical(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _clean_members())
+        out = tmp_path / "out.vsdx"
+        result = shrink_vsdx(str(src), str(out))
+
+        assert result["masters_removed"] == 0
+        assert result["reduction_mb"] == 0.0
+        assert out.read_bytes() == src.read_bytes()
+
+    def test_in_place_noop_leaves_file_untouched(self, tmp_path):
+        src = _write_vsdx(tmp_path / "in.vsdx", _clean_members())
+        original = src.read_bytes()
+        result = shrink_vsdx(str(src), backup=False)
+
+        assert result["masters_removed"] == 0
+        assert src.read_bytes() == original
+
+    def test_stray_master_file_still_deleted(self, tmp_path):
+        """A master*.xml member no relationship points at must be dropped
+        even when every master in masters.xml is used."""
+        members = _clean_members()
+        members["visio/masters/master9.xml"] = "<MasterContents/>" * 20
+        src = _write_vsdx(tmp_path / "in.vsdx", members)
+        out = tmp_path / "out.vsdx"
+        result = shrink_vsdx(str(src), str(out))
+
+        assert result["masters_removed"] == 0
+        assert "visio/masters/master9.xml" not in _member_names(out)
+        assert "visio/masters/master1.xml" in _member_names(out)